@@ -1,18 +1,308 @@
+import hashlib
+import mmap
 import secrets
 import os
-from typing import Dict
-from utils import setup_logger
+import threading
+import weakref
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.keywrap import InvalidUnwrap, aes_key_unwrap, aes_key_wrap
+from utils import make_app_logger
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = make_app_logger('crypto_manager', buffered=True)
+
+# Keyring records: 16-byte file_id digest + 32-byte key wrapped with the master key
+_KEYRING_ID_SIZE = 16
+_KEYRING_RECORD_SIZE = _KEYRING_ID_SIZE + 40
+
+# Live CryptoManager instances, so a forked child can drop the nonce
+# keystream it inherited instead of repeating the parent's nonces
+_instances: 'weakref.WeakSet[CryptoManager]' = weakref.WeakSet()
+
+
+def _reset_nonce_streams() -> None:
+    for manager in list(_instances):
+        manager._nonce_stream = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_nonce_streams)
 
 
 class CryptoManager:
     """
     Handles all cryptographic operations for the system
+    
+    Keyring reads and writes are serialized with a lock, so get_file_key and
+    save_file_keys may be called from several threads. Other methods are not
+    thread-safe.
     """
-    def __init__(self, master_key_path: str):
-        self.master_key_path = master_key_path
+    # AEAD used for file chunks, bound once here. OpenSSL already selects its
+    # AES-NI / ARMv8 or software AES code path when it loads, so there is no
+    # per-call capability check. Every node must use the same AEAD, so this is
+    # not switched per host.
+    _cipher_cls = AESGCM
+    
+    def __init__(self, master_key_path: Union[str, os.PathLike]):
+        self.logger = logger
+        # Use absolute path and normalize for security
+        self.master_key_path = Path(master_key_path).resolve()
         self.master_key = self._load_or_create_master_key()
         self.file_keys: Dict[str, bytes] = {} # file_id -> key mapping
-        self.logger = setup_logger(logger_name='crypto_manager', log_file='logs/crypto_manager.log')
+        self._file_ciphers: Dict[str, Tuple[bytes, AESGCM]] = {} # file_id -> (key, cipher)
+        self._nonce_stream = None # AES-CTR keystream used as a nonce generator
+        _instances.add(self)
+        self._keyring_path = self.master_key_path.with_name(self.master_key_path.name + '.keyring')
+        self._keyring: Optional[mmap.mmap] = None
+        self._keyring_stat: Optional[Tuple[int, int]] = None # (st_ino, st_mtime_ns) of the mapped file
+        self._keyring_lock = threading.Lock() # guards the mapping and keyring rewrites
+    
+    def _fill_keys(self, n: int) -> List[bytes]:
+        """
+        Generate n 32-byte keys with a single read from the OS CSPRNG
+        
+        Returns:
+            List[bytes]: n independent 256-bit keys
+        """
+        pool = os.urandom(32 * n)
+        return [pool[i:i + 32] for i in range(0, 32 * n, 32)]
+    
+    def generate_nonce(self, size: int = 12) -> bytes:
+        """
+        Return a fresh nonce for encrypt_chunk
+        
+        Nonces are not secret, so they are drawn from an AES-CTR keystream
+        seeded once from the OS CSPRNG rather than a syscall per nonce. A
+        forked child reseeds on its first call.
+        """
+        if self._nonce_stream is None:
+            seed = secrets.token_bytes(32)
+            cipher = Cipher(algorithms.AES(seed), modes.CTR(bytes(16)))
+            self._nonce_stream = cipher.encryptor()
+        return self._nonce_stream.update(bytes(size))
+    
+    def _get_file_cipher(self, file_id: str) -> AESGCM:
+        """
+        Return the AES-GCM context for a file, building it once per key
+        
+        Raises:
+            KeyError: If no key is registered for file_id
+        """
+        key = self.get_file_key(file_id)
+        cached = self._file_ciphers.get(file_id)
+        if cached is None or cached[0] is not key:
+            cached = (key, self._cipher_cls(key))
+            self._file_ciphers[file_id] = cached
+        return cached[1]
+    
+    def encrypt_chunk(self, file_id: str, plaintext: bytes, nonce: bytes,
+                      associated_data: Optional[bytes] = None) -> bytes:
+        """
+        Encrypt a chunk of a file with AES-256-GCM using the file's key
+        
+        Args:
+            file_id: Identifier of the file the chunk belongs to
+            plaintext: Chunk contents
+            nonce: 12-byte nonce, must be unique per chunk for this key
+            associated_data: Optional data authenticated but not encrypted
+            
+        Returns:
+            bytes: Ciphertext followed by the 16-byte authentication tag
+        """
+        return self._get_file_cipher(file_id).encrypt(nonce, plaintext, associated_data)
+    
+    def decrypt_chunk(self, file_id: str, ciphertext: bytes, nonce: bytes,
+                      associated_data: Optional[bytes] = None) -> bytes:
+        """
+        Decrypt and authenticate a chunk produced by encrypt_chunk
+        
+        Raises:
+            cryptography.exceptions.InvalidTag: If the chunk fails authentication
+        """
+        return self._get_file_cipher(file_id).decrypt(nonce, ciphertext, associated_data)
+    
+    def get_file_key(self, file_id: str) -> bytes:
+        """
+        Return the key for a file, falling back to the on-disk keyring
+        
+        Raises:
+            KeyError: If no key is known for file_id
+            ValueError: If the keyring exists but is corrupted
+        """
+        key = self.file_keys.get(file_id)
+        if key is None:
+            with self._keyring_lock:
+                key = self._keyring_lookup(file_id)
+            if key is None:
+                raise KeyError(file_id)
+            self.file_keys[file_id] = key
+        return key
+    
+    def save_file_keys(self) -> None:
+        """
+        Persist file_keys to the keyring next to the master key
+        
+        Records are fixed-size and sorted by file_id digest so lookups can
+        binary search the memory-mapped file. Keys are wrapped with the
+        master key (RFC 3394), never stored in the clear.
+        
+        Raises:
+            OSError: If file operations fail
+            ValueError: If the existing keyring is corrupted
+        """
+        with self._keyring_lock:
+            lock_fd = os.open(f"{self._keyring_path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                # Serialize rewrites so concurrent savers never drop each other's keys
+                if fcntl is not None:
+                    fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            
+                # Keep keys that are only on disk, since file_keys is filled lazily.
+                # Re-map first: another instance may have replaced the file since
+                # it was last mapped here
+                wrapped_keys: Dict[bytes, bytes] = {}
+                self._close_keyring()
+                mm = self._open_keyring()
+                if mm is not None:
+                    for offset in range(0, len(mm), _KEYRING_RECORD_SIZE):
+                        record = mm[offset:offset + _KEYRING_RECORD_SIZE]
+                        wrapped_keys[record[:_KEYRING_ID_SIZE]] = record[_KEYRING_ID_SIZE:]
+                for file_id, key in list(self.file_keys.items()):
+                    wrapped_keys[self._keyring_id(file_id)] = aes_key_wrap(self.master_key, key)
+                records = sorted(wrapped_keys.items())
+                size = len(records) * _KEYRING_RECORD_SIZE
+            
+                temp_path = f"{self._keyring_path}.{os.getpid()}.tmp"
+                try:
+                    fd = os.open(temp_path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o600)
+                    try:
+                        if size:
+                            os.ftruncate(fd, size)
+                            with mmap.mmap(fd, size) as mm:
+                                for i, (record_id, wrapped) in enumerate(records):
+                                    offset = i * _KEYRING_RECORD_SIZE
+                                    mm[offset:offset + _KEYRING_RECORD_SIZE] = record_id + wrapped
+                                mm.flush()
+                        os.fsync(fd)
+                    finally:
+                        os.close(fd)
+                
+                    self._close_keyring()
+                    os.rename(temp_path, self._keyring_path)
+                except OSError as e:
+                    self.logger.error("Could not save keyring: %s", e)
+                    try:
+                        os.unlink(temp_path)
+                    except FileNotFoundError:
+                        pass
+                    raise
+            finally:
+                os.close(lock_fd)
+    
+    @staticmethod
+    def _keyring_id(file_id: str) -> bytes:
+        return hashlib.blake2b(file_id.encode(), digest_size=_KEYRING_ID_SIZE).digest()
+    
+    def _keyring_lookup(self, file_id: str) -> Optional[bytes]:
+        """
+        Find a file key in the memory-mapped keyring
+        
+        Returns:
+            Optional[bytes]: The unwrapped key, or None if it is not in the keyring
+            
+        Raises:
+            ValueError: If the keyring or the key's entry is corrupted
+        """
+        record_id = self._keyring_id(file_id)
+        wrapped = self._find_wrapped_key(record_id)
+        if wrapped is None and self._keyring_changed():
+            # Another instance may have saved the key since the file was mapped
+            self._close_keyring()
+            wrapped = self._find_wrapped_key(record_id)
+        if wrapped is None:
+            return None
+        
+        try:
+            return aes_key_unwrap(self.master_key, wrapped)
+        except InvalidUnwrap:
+            self.logger.error("Keyring entry is invalid or corrupted")
+            raise ValueError("Keyring entry could not be unwrapped with the master key")
+    
+    def _find_wrapped_key(self, record_id: bytes) -> Optional[bytes]:
+        """
+        Binary search the mapped keyring for a file_id digest
+        
+        Returns:
+            Optional[bytes]: The wrapped key, or None if it is not in the keyring
+        """
+        mm = self._open_keyring()
+        if mm is None:
+            return None
+        
+        lo, hi = 0, len(mm) // _KEYRING_RECORD_SIZE
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = mid * _KEYRING_RECORD_SIZE
+            current = mm[offset:offset + _KEYRING_ID_SIZE]
+            if current < record_id:
+                lo = mid + 1
+            elif current > record_id:
+                hi = mid
+            else:
+                return mm[offset + _KEYRING_ID_SIZE:offset + _KEYRING_RECORD_SIZE]
+        return None
+    
+    def _keyring_changed(self) -> bool:
+        """
+        Check whether the keyring file on disk differs from the mapped one
+        """
+        try:
+            st = os.stat(self._keyring_path)
+        except FileNotFoundError:
+            return self._keyring_stat is not None
+        return (st.st_ino, st.st_mtime_ns) != self._keyring_stat
+    
+    def _open_keyring(self) -> Optional[mmap.mmap]:
+        """
+        Map the keyring file read-only on first use
+        
+        Returns:
+            Optional[mmap.mmap]: The mapping, or None if the keyring is missing or empty
+            
+        Raises:
+            ValueError: If the keyring size is not a whole number of records
+        """
+        if self._keyring is None:
+            try:
+                fd = os.open(self._keyring_path, os.O_RDONLY | getattr(os, 'O_CLOEXEC', 0))
+            except FileNotFoundError:
+                self._keyring_stat = None
+                return None
+            try:
+                st = os.fstat(fd)
+                self._keyring_stat = (st.st_ino, st.st_mtime_ns)
+                if st.st_size % _KEYRING_RECORD_SIZE:
+                    self.logger.error("Keyring file is invalid or corrupted")
+                    raise ValueError("Keyring size is not a multiple of the record size")
+                if st.st_size == 0:
+                    return None
+                self._keyring = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+            finally:
+                os.close(fd)
+        return self._keyring
+    
+    def _close_keyring(self) -> None:
+        if self._keyring is not None:
+            self._keyring.close()
+            self._keyring = None
+        self._keyring_stat = None
     
     def _load_or_create_master_key(self) -> bytes:
         """
@@ -25,15 +315,18 @@ class CryptoManager:
             OSError: If file operations fail
             ValueError: If the key file exists but is corrupted
         """
-        # Use absolute path and normalize for security
-        key_path = os.path.abspath(os.path.normpath(self.master_key_path))
         try:
-            # Attempt to read existing key with exclusive access
-            with open(key_path, 'rb') as f:
-                key = f.read()
+            # Attempt to read existing key with exclusive access. The key is
+            # tiny, so read it with one unbuffered read; asking for more than
+            # 32 bytes lets an oversized file fail the length check below.
+            fd = os.open(self.master_key_path, os.O_RDONLY | getattr(os, 'O_CLOEXEC', 0))
+            try:
+                key = os.read(fd, 64)
+            finally:
+                os.close(fd)
                 
-            # Validate key integrity
-            if not key or len(key) != 32:
+            # Validate key integrity (an empty file fails the length check too)
+            if len(key) != 32:
                 self.logger.error("Master key file is invalid or corrupted")
                 raise ValueError("Master key has invalid length or is empty")
             
@@ -46,37 +339,42 @@ class CryptoManager:
             key = secrets.token_bytes(32)
             
             # Ensure parent directory exists with secure permissions
-            key_dir = os.path.dirname(self.master_key_path)
             try:
                 # Create directory with secure permissions if it doesn't exist
-                if not os.path.exists(key_dir):
-                    os.makedirs(key_dir, mode=0o600, exist_ok=True)
+                self.master_key_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
             except OSError as e:
-                self.logger.error(f"Could not create key directory: {e}")
+                self.logger.error("Could not create key directory: %s", e)
                 raise
             
             # Create a temporary file in the same directory for atomic move
-            temp_path = f"{key_path}.{os.getpid()}.tmp"
+            temp_path = f"{self.master_key_path}.{os.getpid()}.tmp"
             try:
                 # Create with secure permissions from the start
                 fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
                 try:
-                    with os.fdopen(fd, 'wb') as f:
-                        f.write(key)
-                except Exception as e:
-                    # Make sure we don't leave fd open if write fails
+                    f = os.fdopen(fd, 'wb')
+                except Exception:
+                    # Make sure we don't leave fd open if fdopen fails; once
+                    # wrapped, closing the file object closes the fd
                     os.close(fd)
                     raise
+                with f:
+                    f.write(key)
+                    # Make sure the key is on disk before it is renamed into place
+                    f.flush()
+                    os.fsync(f.fileno())
                 
                 # Atomic rename for crash safety
-                os.rename(temp_path, key_path)
+                os.rename(temp_path, self.master_key_path)
                 
                 self.logger.info("Successfully created new master key")
                 return key
             
             except OSError as e:
-                self.logger.error(f"Cound not create master key file: {e}")
+                self.logger.error("Could not create master key file: %s", e)
                 # Clean up temp file if it exists
-                if os.path.exists(temp_path):
+                try:
                     os.unlink(temp_path)
+                except FileNotFoundError:
+                    pass
                 raise
\ No newline at end of file
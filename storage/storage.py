@@ -1,36 +1,61 @@
 import json
 import os
 import asyncio
+from functools import cached_property
+from pathlib import Path
 from typing import Dict, Any
-from utils import setup_logger, load_config
+from utils import make_app_logger
 from storage import FileManager
 from crypto import CryptoManager
 from node import NodeManager
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = make_app_logger('secure_storage')
+
+
 class SecureStorage:
     """
     Main orchestrator for the secure distributed storage system
     """
     def __init__(self, config_path: str = "config.json"):
         self.config = self._load_config(config_path)
-        self.logger = setup_logger(logger_name='secure_storage', log_file='logs/secure_storage.log')
-        self.crypto_manager = CryptoManager(self.config['master_key_path'])
-        self.node_manager = NodeManager(
+        self.logger = logger
+        self.running = False
+        self._scheduler_task = None
+        self._jobs: Dict[str, asyncio.Task] = {} # job name -> running task
+    
+    # Components are built on first access so that constructing a
+    # SecureStorage does not load keys or open databases until needed
+    @cached_property
+    def crypto_manager(self) -> CryptoManager:
+        return CryptoManager(self.config['master_key_path'])
+    
+    @cached_property
+    def node_manager(self) -> NodeManager:
+        return NodeManager(
             self.config["nodes_db_path"],
             self.crypto_manager,
             use_tor=self.config["use_tor"]
         )
-        self.file_manager = FileManager(
+    
+    @cached_property
+    def file_manager(self) -> FileManager:
+        return FileManager(
             self.config["local_storage_path"],
             self.crypto_manager,
             self.node_manager
         )
-        self.running = False
     
     def _load_config(self, config_path: str) -> Dict[str, Any]:
+        config_path = Path(config_path).resolve()
         try:
-            with open(config_path, 'r') as f:
-                config = json.loads(f)
+            with open(config_path, 'rb') as f:
+                data = f.read()
+            config = orjson.loads(data) if orjson else json.loads(data)
                 
             # Validate required fields
             required_fields = [
@@ -55,9 +80,39 @@ class SecureStorage:
                 "chunk_size": 4 * 1024 * 1024
             }
             
-            os.makedirs(os.path.dirname(config_path), exist_ok=True)
-            with open(config_path, 'w') as f:
-                json.dump(default_config, f, indent=2)
+            if orjson:
+                data = orjson.dumps(default_config, option=orjson.OPT_INDENT_2)
+            else:
+                data = json.dumps(default_config, indent=2).encode()
+            
+            config_path.parent.mkdir(parents=True, exist_ok=True)
+            
+            # Write to a temporary file and rename so a crash never leaves
+            # a truncated config behind
+            temp_path = f"{config_path}.{os.getpid()}.tmp"
+            try:
+                fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                try:
+                    f = os.fdopen(fd, 'wb')
+                except Exception:
+                    # Make sure we don't leave fd open if fdopen fails; once
+                    # wrapped, closing the file object closes the fd
+                    os.close(fd)
+                    raise
+                with f:
+                    f.write(data)
+                    # Make sure the config is on disk before it is renamed into place
+                    f.flush()
+                    os.fsync(f.fileno())
+                
+                # Atomic rename for crash safety
+                os.rename(temp_path, config_path)
+            except OSError:
+                try:
+                    os.unlink(temp_path)
+                except FileNotFoundError:
+                    pass
+                raise
                 
             return default_config
     
@@ -71,8 +126,7 @@ class SecureStorage:
         await self.file_manager.initialize()
         
         # Start background tasks
-        asyncio.create_task(self._periodic_health_check())
-        asyncio.create_task(self._periodic_rebalance())
+        self._scheduler_task = asyncio.create_task(self._scheduler())
         
         self.logger.info("System started successfully")
         
@@ -80,6 +134,20 @@ class SecureStorage:
         """Stop the storage system"""
         self.logger.info("Stopping Secure Storage System") 
         self.running = False
+        if self._scheduler_task is not None:
+            # The scheduler only ever waits in asyncio.sleep, so this never
+            # interrupts a job
+            self._scheduler_task.cancel()
+            try:
+                await self._scheduler_task
+            except asyncio.CancelledError:
+                pass
+            self._scheduler_task = None
+        
+        # Let maintenance jobs that are already running finish
+        if self._jobs:
+            await asyncio.gather(*self._jobs.values(), return_exceptions=True)
+            self._jobs.clear()
         
         # Clean up resources
         await self.node_manager.shutdown()
@@ -87,24 +155,39 @@ class SecureStorage:
         
         self.logger.info("System stopped successfully")    
         
-    async def _periodic_health_check(self):
-        """Periodically check the health of storage nodes"""
+    async def _scheduler(self):
+        """Run periodic maintenance jobs from a single background task"""
+        loop = asyncio.get_running_loop()
+        next_health = next_rebalance = loop.time()
         while self.running:
-            try:
-                self.logger.debug("Running periodic health check")   
-                await self.node_manager.check_nodes_health()
-            except Exception as e:
-                self.logger.error(f"Error in health check: {e}")
+            now = loop.time()
+            if now >= next_health:
+                self._start_job('health_check', self._health_check)
+                next_health = now + 300 # Run every 5 minutes
+            if now >= next_rebalance:
+                self._start_job('rebalance', self._rebalance)
+                next_rebalance = now + 3600 # Run every hour
             
-            await asyncio.sleep(300) # Run every 5 minutes
+            await asyncio.sleep(max(0, min(next_health, next_rebalance) - loop.time()))
+    
+    def _start_job(self, name: str, job) -> None:
+        """Start a maintenance job in its own task unless it is still running"""
+        task = self._jobs.get(name)
+        if task is None or task.done():
+            self._jobs[name] = asyncio.create_task(job())
+        
+    async def _health_check(self):
+        """Check the health of storage nodes"""
+        try:
+            self.logger.debug("Running periodic health check")   
+            await self.node_manager.check_nodes_health()
+        except Exception as e:
+            self.logger.error("Error in health check: %s", e)
             
-    async def _periodic_rebalance(self):
-        """Periodically rebalance data across nodes if needed"""
-        while self.running:
-            try:
-                self.logger.debug("Running periodic rebalance")
-                await self.file_manager.rebalance_data()
-            except Exception as e:
-                self.logger.error(f"Error in rebalance: {e}")
-                
-            await asyncio.sleep(3600) # Run every hour
\ No newline at end of file
+    async def _rebalance(self):
+        """Rebalance data across nodes if needed"""
+        try:
+            self.logger.debug("Running periodic rebalance")
+            await self.file_manager.rebalance_data()
+        except Exception as e:
+            self.logger.error("Error in rebalance: %s", e)
\ No newline at end of file
@@ -0,0 +1,122 @@
+import os
+import tempfile
+import unittest
+
+from crypto import CryptoManager
+from crypto.crypto_manager import _KEYRING_RECORD_SIZE
+
+
+class KeyringTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.key_path = os.path.join(self._tmp.name, 'keys', 'master.key')
+        self.keyring_path = self.key_path + '.keyring'
+
+    def _manager(self) -> CryptoManager:
+        manager = CryptoManager(self.key_path)
+        self.addCleanup(manager._close_keyring)
+        return manager
+
+    def test_round_trip(self):
+        manager = self._manager()
+        keys = manager._fill_keys(100)
+        for i, key in enumerate(keys):
+            manager.file_keys[f'file-{i}'] = key
+        manager.save_file_keys()
+
+        reloaded = self._manager()
+        self.assertEqual(reloaded.master_key, manager.master_key)
+        for i, key in enumerate(keys):
+            self.assertEqual(reloaded.get_file_key(f'file-{i}'), key)
+
+    def test_keys_are_not_stored_in_clear(self):
+        manager = self._manager()
+        key = manager._fill_keys(1)[0]
+        manager.file_keys['file'] = key
+        manager.save_file_keys()
+
+        with open(self.keyring_path, 'rb') as f:
+            data = f.read()
+        self.assertEqual(len(data), _KEYRING_RECORD_SIZE)
+        self.assertNotIn(key, data)
+
+    def test_chunk_round_trip_after_reload(self):
+        manager = self._manager()
+        manager.file_keys['file'] = manager._fill_keys(1)[0]
+        manager.save_file_keys()
+        nonce = manager.generate_nonce()
+        ciphertext = manager.encrypt_chunk('file', b'chunk data', nonce)
+
+        reloaded = self._manager()
+        self.assertEqual(reloaded.decrypt_chunk('file', ciphertext, nonce), b'chunk data')
+
+    def test_missing_key(self):
+        manager = self._manager()
+        with self.assertRaises(KeyError):
+            manager.get_file_key('missing')
+
+        manager.file_keys['file'] = manager._fill_keys(1)[0]
+        manager.save_file_keys()
+        with self.assertRaises(KeyError):
+            self._manager().get_file_key('missing')
+
+    def test_truncated_keyring(self):
+        manager = self._manager()
+        manager.file_keys['file'] = manager._fill_keys(1)[0]
+        manager.save_file_keys()
+        with open(self.keyring_path, 'r+b') as f:
+            f.truncate(_KEYRING_RECORD_SIZE - 1)
+
+        reloaded = self._manager()
+        with self.assertRaises(ValueError):
+            reloaded.get_file_key('file')
+        with self.assertRaises(ValueError):
+            reloaded.save_file_keys()
+
+    def test_corrupted_entry(self):
+        manager = self._manager()
+        manager.file_keys['file'] = manager._fill_keys(1)[0]
+        manager.save_file_keys()
+        with open(self.keyring_path, 'r+b') as f:
+            f.seek(_KEYRING_RECORD_SIZE - 1)
+            last = f.read(1)
+            f.seek(_KEYRING_RECORD_SIZE - 1)
+            f.write(bytes([last[0] ^ 1]))
+
+        with self.assertRaises(ValueError):
+            self._manager().get_file_key('file')
+
+    def test_concurrent_instances_keep_all_keys(self):
+        first = self._manager()
+        second = self._manager()
+        first.file_keys['a1'] = first._fill_keys(1)[0]
+        first.save_file_keys()
+
+        # second maps the keyring before first saves again
+        self.assertEqual(second.get_file_key('a1'), first.file_keys['a1'])
+        first.file_keys['a2'] = first._fill_keys(1)[0]
+        first.save_file_keys()
+        second.file_keys['b'] = second._fill_keys(1)[0]
+        second.save_file_keys()
+
+        reloaded = self._manager()
+        for file_id, key in [('a1', first.file_keys['a1']),
+                             ('a2', first.file_keys['a2']),
+                             ('b', second.file_keys['b'])]:
+            self.assertEqual(reloaded.get_file_key(file_id), key)
+
+    def test_lookup_sees_keys_saved_by_other_instance(self):
+        first = self._manager()
+        second = self._manager()
+        first.file_keys['a1'] = first._fill_keys(1)[0]
+        first.save_file_keys()
+        self.assertEqual(second.get_file_key('a1'), first.file_keys['a1'])
+
+        first.file_keys['a2'] = first._fill_keys(1)[0]
+        first.save_file_keys()
+        self.assertEqual(second.get_file_key('a2'), first.file_keys['a2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
\ No newline at end of file
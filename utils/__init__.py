@@ -1 +1 @@
-from .logger import setup_logger
\ No newline at end of file
+from .logger import setup_logger, make_app_logger
\ No newline at end of file
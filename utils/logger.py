@@ -1,42 +1,292 @@
+import atexit
 import logging
 import os
+import queue
 import sys
-from logging import RotatingFileHandler
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Log directories already created by setup_logger
+_ensured_dirs: set[str] = set()
+
+# Names of loggers already configured by setup_logger
+_configured: set[str] = set()
+
+# Loggers created by make_app_logger: name -> (logger, buffered)
+_app_loggers: dict[str, tuple[logging.Logger, bool]] = {}
+
+# Records from every configured logger go through one queue and are written
+# by a single background listener thread. Forked children write
+# synchronously instead, see _after_fork_in_child.
+_log_queue: queue.SimpleQueue = queue.SimpleQueue()
+_listener: QueueListener = None
+_logger_handlers: dict[str, list[logging.Handler]] = {}
+
+# Record attributes that need Logger.findCaller's stack walk
+_CALLER_FIELDS = ("%(pathname)", "%(filename)", "%(module)", "%(lineno)", "%(funcName)")
+
+
+class _NoCallerLogger(logging.Logger):
+    """
+    Logger that skips the caller-frame lookup, for loggers whose format
+    does not show the caller.
+    """
+    def findCaller(self, stack_info=False, stacklevel=1):
+        if stack_info:
+            return super().findCaller(stack_info, stacklevel)
+        return "(unknown file)", 0, "(unknown function)", None
+
+
+class _FastRotatingFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler that skips the filesystem checks in shouldRollover
+    while the file is still well below maxBytes.
+
+    With a flush_every above 1 it also writes through a large buffer that is
+    flushed every flush_every records, every flush_interval seconds, on
+    records at or above flush_level, and whenever the log queue runs empty.
+    """
+    buffer_size = 64 * 1024
+
+    def __init__(self, *args, flush_level: int = logging.WARNING,
+                 flush_every: int = 1, flush_interval: float = 1.0, **kwargs):
+        self.flush_level = flush_level
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._since_flush = 0
+        self._last_flush = time.monotonic()
+        self._defer_flush = False
+        self._stream_size = 0
+        self._pending_len = 0
+        super().__init__(*args, **kwargs)
+
+    def _open(self):
+        stream = self._builtin_open(self.baseFilename, self.mode,
+                                    buffering=self.buffer_size,
+                                    encoding=self.encoding, errors=self.errors)
+        self._stream_size = stream.tell()
+        return stream
+
+    def emit(self, record):
+        self._since_flush += 1
+        self._defer_flush = (record.levelno < self.flush_level
+                             and self._since_flush < self.flush_every
+                             and time.monotonic() - self._last_flush < self.flush_interval)
+        try:
+            super().emit(record)
+        finally:
+            self._defer_flush = False
+        self._stream_size += self._pending_len
+
+    def flush(self):
+        # StreamHandler.emit flushes after every record; skip that until a
+        # flush is due. close() and rollover still flush the stream.
+        if not self._defer_flush:
+            super().flush()
+            self._since_flush = 0
+            self._last_flush = time.monotonic()
+
+    def shouldRollover(self, record):
+        if self.stream is None or self.maxBytes <= 0:
+            self._pending_len = 0
+            return super().shouldRollover(record)
+        # stream.tell() on a text stream flushes it, so track the size in
+        # bytes ourselves and only ask the base class near the limit
+        msg = "%s\n" % self.format(record)
+        if msg.isascii():
+            self._pending_len = len(msg)
+        else:
+            self._pending_len = len(msg.encode(self.stream.encoding, self.errors or 'strict'))
+        if self._stream_size + self._pending_len < self.maxBytes:
+            return 0
+        # Near the limit: check the real position. The base class compares
+        # it against the length in characters, so do the check here and only
+        # keep its guard against rolling over non-regular files (bpo-45401)
+        self.stream.seek(0, 2)
+        self._stream_size = self.stream.tell()
+        if self._stream_size + self._pending_len < self.maxBytes:
+            return 0
+        if os.path.exists(self.baseFilename) and not os.path.isfile(self.baseFilename):
+            return 0
+        return 1
+
+
+class _SimpleQueueHandler(QueueHandler):
+    """
+    QueueHandler for the shared SimpleQueue that hands records over with
+    their message merged, leaving the full formatting to the listener.
+    """
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        self.queue.put(record)
+
+
+class _DispatchHandler(logging.Handler):
+    """
+    Listener-side handler that forwards a record to the handlers registered
+    for the logger that produced it.
+    """
+    def handle(self, record):
+        for handler in _logger_handlers.get(record.name, ()):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+        return True
+
+    def flush(self):
+        for handlers in list(_logger_handlers.values()):
+            for handler in handlers:
+                handler.flush()
+
+
+class _FlushingQueueListener(QueueListener):
+    """
+    QueueListener that flushes every handler whenever the queue runs empty,
+    so buffered log lines are not held back while a logger is idle.
+    """
+    def dequeue(self, block):
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            for handler in self.handlers:
+                handler.flush()
+            return self.queue.get(block)
+
+
+class _DirectQueue:
+    """
+    Stand-in for the log queue in a forked child. The listener thread does
+    not survive fork(), and children often leave through os._exit without
+    running atexit, so records are written synchronously instead.
+    """
+    def __init__(self):
+        self._dispatch = _DispatchHandler()
+
+    def put(self, record):
+        self._dispatch.handle(record)
+        self._dispatch.flush()
+
+    put_nowait = put
+
+
+def _ensure_listener() -> None:
+    """
+    Start the shared queue listener on first use.
+    """
+    global _listener
+    if _listener is None and not isinstance(_log_queue, _DirectQueue):
+        _listener = _FlushingQueueListener(_log_queue, _DispatchHandler())
+        _listener.start()
+        atexit.register(_stop_listener)
+
+
+def _stop_listener() -> None:
+    if _listener is not None:
+        _listener.stop()
+
+
+def _after_fork_in_child() -> None:
+    """
+    Switch a forked child's loggers to synchronous writes.
+    """
+    global _log_queue, _listener
+    _log_queue = _DirectQueue()
+    _listener = None
+    for name in _configured:
+        for handler in logging.getLogger(name).handlers:
+            if isinstance(handler, _SimpleQueueHandler):
+                handler.queue = _log_queue
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
 
 def setup_logger(
     logger_name: str = "app",
     log_level: int = logging.INFO,
-    log_format: str = "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    log_format: str = "%(created).3f %(name)s %(levelname)s %(message)s",
     log_file: str = None,
     max_file_size: int = 10 * 1024 * 1024,  # 10 MB
     backup_count: int = 5,
-    console_output: bool = True
+    console_output: bool = True,
+    buffered: bool = False
 ) -> logging.Logger:
     """
     Configure and return logger instance.
-    """
-    logger = logging.getLogger(logger_name)
 
+    With buffered=True the log file is flushed in batches instead of after
+    every record; meant for loggers that write at a high rate.
+
+    The returned logger only merges each record's message arguments and
+    enqueues it; formatting and writing to the file and console handlers
+    happens on a background listener thread.
+    """
     # Prevent duplicate handlers if logger is already set up
+    if logger_name in _configured:
+        return logging.getLogger(logger_name)
+
+    logger = logging.getLogger(logger_name)
     if len(logger.handlers) > 0:
-        return logger  # Logger already configured
+        _configured.add(logger_name)
+        return logger  # Logger configured elsewhere
 
     logger.setLevel(log_level)
+    # Only this logger skips the stack walk, and only if its format has no
+    # use for the caller's file, line or function
+    if type(logger) is logging.Logger and not any(f in log_format for f in _CALLER_FIELDS):
+        logger.__class__ = _NoCallerLogger
     formatter = logging.Formatter(log_format)
+    handlers: list[logging.Handler] = []
 
     # File logging
     if log_file:
-        os.makedirs(os.path.dirname(log_file), exist_ok=True)
-        file_handler = RotatingFileHandler(
-            log_file, maxBytes=max_file_size, backupCount=backup_count
+        log_dir = os.path.dirname(log_file)
+        if log_dir and log_dir not in _ensured_dirs:
+            os.makedirs(log_dir, exist_ok=True)
+            _ensured_dirs.add(log_dir)
+        file_handler = _FastRotatingFileHandler(
+            log_file, maxBytes=max_file_size, backupCount=backup_count,
+            flush_every=256 if buffered else 1
         )
         file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
+        handlers.append(file_handler)
 
     # Console logging
     if console_output:
         console_handler = logging.StreamHandler(sys.stdout)
         console_handler.setFormatter(formatter)
-        logger.addHandler(console_handler)
+        handlers.append(console_handler)
 
-    return logger
\ No newline at end of file
+    if handlers:
+        _logger_handlers[logger_name] = handlers
+        _ensure_listener()
+        logger.addHandler(_SimpleQueueHandler(_log_queue))
+
+    _configured.add(logger_name)
+
+    return logger
+
+
+def make_app_logger(name: str, buffered: bool = False) -> logging.Logger:
+    """
+    Return the logger for an application component, writing to
+    logs/<name>.log and the console with the default settings.
+
+    Raises:
+        ValueError: If the logger was already created with a different
+            buffered setting
+    """
+    entry = _app_loggers.get(name)
+    if entry is None:
+        logger = setup_logger(logger_name=name, log_file=f"logs/{name}.log",
+                              buffered=buffered)
+        entry = _app_loggers[name] = (logger, buffered)
+    elif entry[1] != buffered:
+        raise ValueError(
+            f"Logger {name!r} already exists with buffered={entry[1]}"
+        )
+    return entry[0]
\ No newline at end of file